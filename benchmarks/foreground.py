@@ -0,0 +1,39 @@
+# coding: utf-8
+"""Compare the cost of resolving the foreground process path on Linux with the persistent python-xlib
+connection and with the xprop subprocesses.
+
+Run it from an X11 session: python benchmarks/foreground.py [iterations]"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import common.tools as tools
+
+
+def measure(func, iterations):
+    result = func()  # The first call opens the X11 connection
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return result, (time.perf_counter() - start) / iterations * 1000
+
+
+def main(iterations=200):
+    if not os.environ.get('DISPLAY'):
+        sys.exit('An X11 session is needed, DISPLAY is not set')
+    backends = {'xprop': tools.get_foregroundpath_xprop}
+    if tools.X11Display.is_available():
+        backends['python-xlib'] = tools.x11display.get_foregroundpath
+    else:
+        print('python-xlib is not installed, only measuring xprop')
+    timings = {}
+    for name, func in backends.items():
+        path, timings[name] = measure(func, iterations)
+        print('{:<12} {:>8.3f} ms per call   {}'.format(name, timings[name], path))
+    if len(timings) == 2:
+        print('python-xlib is {:.0f}x faster'.format(timings['xprop'] / timings['python-xlib']))
+
+
+if __name__ == '__main__':
+    main(*[int(i) for i in sys.argv[1:2]])
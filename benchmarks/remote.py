@@ -0,0 +1,112 @@
+# coding: utf-8
+"""Load the web remote with concurrent clients on each server backend and report the latencies.
+
+Every backend is started on a free local port. The clients first open their /events streams and keep them open, then
+request / and /api/status while the streams hold their server threads, like browsers left open on the remote would.
+
+Run it from the repository: python benchmarks/remote.py [clients] [requests] [backend ...]"""
+import os
+import sys
+import time
+import socket
+import threading
+import statistics
+import http.client
+import importlib.util
+import concurrent.futures
+import wsgiref.simple_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import common.manager
+import common.remote
+
+wsgiref.simple_server.WSGIRequestHandler.log_message = lambda *args: None  # The access log would drown the report
+BACKENDS = {'threaded': None, 'wsgiref': None, 'cherrypy': 'cherrypy', 'cheroot': 'cheroot'}  # Module needed by each backend
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(backend):
+    manager = common.manager.ManageStream()
+    manager.config['base']['server'] = backend
+    remote = common.remote.WebRemote()
+    remote.port = free_port()
+    threading.Thread(target=remote.server, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', remote.port), timeout=1).close()
+            return remote.port
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('The {} backend did not start'.format(backend))
+
+
+def fetch(port, path, count):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        connection.request('GET', path)
+        connection.getresponse().read()
+        timings.append(time.perf_counter() - start)
+    connection.close()
+    return timings
+
+
+def open_stream(port):
+    # Time until the first event, None when the server refused the stream
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    start = time.perf_counter()
+    connection.request('GET', '/events')
+    response = connection.getresponse()
+    if response.status != 200:
+        response.read()
+        connection.close()
+        return connection, None
+    response.readline()
+    return connection, time.perf_counter() - start
+
+
+def report(name, timings, refused=0, elapsed=None):
+    if not timings:
+        print('  {:<12} {:>5} refused'.format(name, refused))
+        return
+    timings = sorted(i * 1000 for i in timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    line = '  {:<12} {:>7.1f} ms p50 {:>7.1f} ms p95 {:>7.1f} ms max {:>6} requests {:>5} refused'.format(name, statistics.median(timings), p95, timings[-1], len(timings), refused)
+    if elapsed:
+        line += ' {:>7.0f} requests/s'.format(len(timings) / elapsed)
+    print(line)
+
+
+def run(backend, clients, requests):
+    port = start_server(backend)
+    print('{} backend, {} clients'.format(backend, clients))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=clients) as pool:
+        streams = list(pool.map(lambda _: open_stream(port), range(clients)))
+        opened = [timing for _, timing in streams if timing is not None]
+        report('/events', opened, refused=len(streams) - len(opened))
+        for path in ('/', '/api/status'):
+            start = time.perf_counter()
+            timings = [i for result in pool.map(lambda _: fetch(port, path, requests), range(clients)) for i in result]
+            report(path, timings, elapsed=time.perf_counter() - start)
+    for connection, _ in streams:
+        connection.close()
+
+
+def main(clients=16, requests=50, *backends):
+    for backend in backends or BACKENDS:
+        module = BACKENDS.get(backend, backend)
+        if module and not importlib.util.find_spec(module):
+            print('{} backend skipped, {} is not installed'.format(backend, module))
+            continue
+        run(backend, int(clients), int(requests))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
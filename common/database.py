@@ -0,0 +1,212 @@
+import os
+import json
+import heapq
+import array
+import sqlite3
+import logging
+import threading
+import collections
+
+import common.tools as tools
+logger = logging.getLogger(__name__)
+
+
+def trigrams(text):
+    text = '  {} '.format(text)
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+class GameDatabase():
+    """Game database stored in SQLite next to its JSON source, entries are only decoded when requested.
+    The SQLite file is rebuilt whenever the JSON file is modified outside of this class."""
+    schema = """
+        CREATE TABLE IF NOT EXISTS games (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, folded TEXT NOT NULL, size INTEGER NOT NULL, data TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS games_folded ON games (folded);
+        CREATE TABLE IF NOT EXISTS trigrams (trigram TEXT NOT NULL, game INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS trigrams_trigram ON trigrams (trigram);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dbpath = os.path.splitext(path)[0] + '.sqlite'
+        self._connection = None
+        self.postings = None  # Trigram posting lists, loaded by the first fuzzy search
+        self.sizes = {}
+        self.lock = threading.RLock()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            with self.lock:
+                if self._connection is None:
+                    connection = self.open_connection()
+                    connection.executescript(self.schema)
+                    if self.get_meta(connection, 'source') != self.source_signature():
+                        self.from_json(self.path, connection)
+                    self._connection = connection
+        return self._connection
+
+    def open_connection(self):
+        connection = sqlite3.connect(self.dbpath, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')  # Readers keep their snapshot while another connection writes
+        return connection
+
+    def source_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return ''
+        return '{}:{}'.format(stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def get_meta(connection, key):
+        row = connection.execute('SELECT value FROM meta WHERE key=?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def from_json(self, path, connection=None):
+        connection = connection or self.connection
+        logger.info('Converting the game database {}'.format(path))
+        with self.lock, connection:
+            connection.execute('DELETE FROM games')
+            connection.execute('DELETE FROM trigrams')
+            connection.execute('DROP INDEX trigrams_trigram')  # Faster to index once everything is inserted
+            for name, entry in (tools.load_json(path) or {}).items():
+                self.write_entry(connection, name, entry)
+            connection.execute('CREATE INDEX trigrams_trigram ON trigrams (trigram)')
+            connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('source', self.source_signature()))
+
+    def to_json(self, path):
+        self.connection
+        connection = self.open_connection()
+        try:
+            return tools.save_file(self.iter_json(connection), path)
+        finally:
+            connection.close()
+
+    def iter_json(self, connection):
+        # Same output as json.dump(data, indent=4) without holding the whole database in memory
+        separator = '{\n    '
+        for name, entry in connection.execute('SELECT name, data FROM games ORDER BY id'):
+            yield '{}{}: {}'.format(separator, json.dumps(name), json.dumps(json.loads(entry), indent=4).replace('\n', '\n    '))
+            separator = ',\n    '
+        yield '\n}' if separator != '{\n    ' else '{}'
+
+    def write_entry(self, connection, name, entry):
+        row = connection.execute('SELECT id FROM games WHERE name=?', (name,)).fetchone()
+        if row:
+            connection.execute('UPDATE games SET data=? WHERE id=?', (json.dumps(entry), row[0]))
+            return
+        grams = trigrams(name.casefold())
+        cursor = connection.execute('INSERT INTO games (name, folded, size, data) VALUES (?, ?, ?, ?)', (name, name.casefold(), len(grams), json.dumps(entry)))
+        connection.executemany('INSERT INTO trigrams VALUES (?, ?)', [(i, cursor.lastrowid) for i in grams])
+        self.postings = None
+
+    def __contains__(self, name):
+        with self.lock:
+            return bool(self.connection.execute('SELECT 1 FROM games WHERE name=?', (name,)).fetchone())
+
+    def __getitem__(self, name):
+        entry = self.get(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+    def get(self, name, default=None):
+        with self.lock:
+            row = self.connection.execute('SELECT data FROM games WHERE name=?', (name,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def keys(self):
+        with self.lock:
+            return [i[0] for i in self.connection.execute('SELECT name FROM games ORDER BY folded')]
+
+    def prefix(self, text, limit=20):
+        text = text.casefold()
+        with self.lock:
+            rows = self.connection.execute('SELECT name FROM games WHERE folded >= ? AND folded < ? ORDER BY folded LIMIT ?', (text, text + '\uffff', limit))
+            return [i[0] for i in rows]
+
+    def load_postings(self):
+        # Counting the hits of every query trigram takes a few milliseconds on arrays but tens of them in SQL
+        postings = {}
+        for trigram, game in self.connection.execute('SELECT trigram, game FROM trigrams'):
+            posting = postings.get(trigram)
+            if posting is None:
+                posting = postings[trigram] = array.array('i')
+            posting.append(game)
+        self.sizes = dict(self.connection.execute('SELECT id, size FROM games'))
+        self.postings = postings
+
+    def fuzzy(self, text, limit=20):
+        query = trigrams(text.casefold())
+        with self.lock:
+            if self.postings is None:
+                self.load_postings()
+            postings, sizes = self.postings, self.sizes
+        hits = collections.Counter()
+        for trigram in query:
+            hits.update(postings.get(trigram, ()))
+        scores = {game: count / (len(query) + sizes[game] - count) for game, count in hits.items()}  # Jaccard index of the two trigram sets
+        best = heapq.nlargest(limit, scores.values())
+        if not best:
+            return []
+        games = [game for game, score in scores.items() if score >= best[-1] and score > 0.2]  # Ties are ordered by name
+        rows = []
+        with self.lock:
+            for i in range(0, len(games), 500):
+                chunk = games[i:i + 500]
+                rows += self.connection.execute('SELECT id, name, folded FROM games WHERE id IN ({})'.format(','.join('?' * len(chunk))), chunk).fetchall()
+        rows.sort(key=lambda x: (-scores[x[0]], x[2]))
+        return [name for _, name, _ in rows[:limit]]
+
+    def search(self, text, limit=20):
+        if not text:
+            return []
+        result = self.prefix(text, limit)
+        if len(result) < limit:
+            result += [i for i in self.fuzzy(text, limit) if i not in result][:limit - len(result)]
+        return result
+
+    def import_json(self, path, policy='remote'):
+        """Merge a JSON database entry by entry, policy decides which side wins on conflicts: local, remote or newest.
+        The import writes through its own connection, searches only wait for its commit."""
+        stats = {'added': 0, 'updated': 0, 'skipped': 0}
+        self.connection  # Creates or converts the database first
+        connection = self.open_connection()
+        try:
+            for name, entry in tools.iter_json_items(path):
+                row = connection.execute('SELECT data FROM games WHERE name=?', (name,)).fetchone()
+                current = json.loads(row[0]) if row else None
+                if current is None:
+                    stats['added'] += 1
+                elif policy == 'local' or (policy == 'newest' and str(entry.get('updated', '')) <= str(current.get('updated', ''))):
+                    stats['skipped'] += 1
+                    continue
+                else:
+                    merged = json.loads(json.dumps(current))
+                    tools.merge_dict(merged, entry)
+                    if merged == current:
+                        stats['skipped'] += 1
+                        continue
+                    entry = merged
+                    stats['updated'] += 1
+                self.write_entry(connection, name, entry)
+            with self.lock:
+                connection.commit()
+                self.postings = None
+        finally:
+            connection.close()  # Rolls back a failed import
+        if stats['added'] or stats['updated']:
+            self.save()
+        return stats
+
+    def save(self):
+        self.to_json(self.path)
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('source', self.source_signature()))
+        return True
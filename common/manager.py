@@ -5,12 +5,14 @@ import time
 import json
 import socket
 import atexit
+import asyncio
 import logging
 import traceback
 import subprocess
 import concurrent.futures
 
 import common.tools as tools
+import common.database
 
 logger = logging.getLogger(__name__)
 
@@ -26,10 +28,23 @@ class ManageStream(tools.Borg):
             self.services = {}
             self.commandbots = {}
             self.currentkey = set()
+            self.config_version = 0
+            self.pathmatchers = {}
+            self.informations = {}
+            self.savedconfig = None
+            self.saveconfig_later = tools.Debouncer(self.save_config)
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(4, len(SERVICES) * 2))
+            self.loop = tools.start_eventloop()
+            self.infospoller = None
+            self.infos_updated = 0
+            self.infos_snapshot = None
+            self.statechanged = tools.ChangeNotifier()
             self.config_filepath = os.path.join(os.path.dirname(__file__), '..', 'data', 'settings.json')
+            self.categories = tools.PersistentCache(os.path.join(os.path.dirname(__file__), '..', 'data', 'cache', 'categories.json'))
             self.load_config()
             self.conform_preferences()
             self.load_database()
+            atexit.register(self.stop_services)
             socket.setdefaulttimeout(int(self.config['base']['timeout']))
 
     def conform_preferences(self):
@@ -40,11 +55,17 @@ class ManageStream(tools.Borg):
             "title": "",
             "description": "",
             "port": 8080,
+            "host": "0.0.0.0",
+            "server": "threaded",
+            "workers": "16",
             "autostart": False,
             "starttray": False,
             "checktimer": "60",
+            "infostimer": "30",
             "reload": "5",
             "timeout": "10",
+            "poolsize": "4",
+            "retries": "2",
             "processes": [],
             "category": "",
             "services": [],
@@ -56,6 +77,7 @@ class ManageStream(tools.Borg):
             "forced_tags": False
             },
         "assignations": {},
+        "updated": {},
         "shortcuts": {
             "create_clip": "Ctrl+F9",
             "create_marker": "Ctrl+F10"
@@ -71,20 +93,42 @@ class ManageStream(tools.Borg):
         config = tools.load_json(path, backup)
         if config:
             self.config = config or {}
+            self.config_changed()
+            if path == self.config_filepath:
+                self.saveconfig_later.cancel()
+                self.savedconfig = json.dumps(config, indent=4)
             return config
         return config
 
     def save_config(self, path=''):
+        if not path:
+            self.saveconfig_later.cancel()
         path = path or self.config_filepath
         for name, service in self.services.items():
             self.config['streamservices'][name] = service.config
         try:
-            return tools.save_json(self.config, path)
+            content = self.dump_config()
+            if path == self.config_filepath and content == self.savedconfig:
+                return True  # Nothing changed since the last write
+            tools.save_file(content, path)
+            if path == self.config_filepath:
+                self.savedconfig = content
+            return True
         except:
             logger.critical(traceback.print_exc())
             logging.error(self.config)
             return False
 
+    def dump_config(self, attempts=5):
+        for attempt in range(attempts):
+            try:
+                return json.dumps(self.config, indent=4)
+            except RuntimeError:
+                # The config was modified by another thread while serializing it
+                if attempt == attempts - 1:
+                    raise
+                logger.debug('Configuration changed during the save, trying again')
+
     def load_credentials(self, path=''):
         path = path or self.config_filepath.replace('settings.json', 'credentials.json')
         config = tools.load_json(path, backup=False)
@@ -96,13 +140,13 @@ class ManageStream(tools.Borg):
 
     def load_database(self, path=''):
         path = path or self.config_filepath.replace('settings.json', 'database.json')
-        self.database = tools.load_json(path) or {}
+        self.database = common.database.GameDatabase(path)
         return self.database
 
-    def import_database(self, path=''):
-        database = tools.load_json(path)
-        tools.merge_dict(self.database, database)
-        tools.save_json(self.database, self.config_filepath.replace('settings.json', 'database.json'))
+    def import_database(self, path='', policy='remote'):
+        stats = self.database.import_json(path, policy)
+        logger.info('Imported game database {}: {added} added, {updated} updated, {skipped} skipped'.format(path, **stats))
+        return stats
 
     def export_database(self, path=''):
         keys = list(set(list(self.config['assignations'].keys()) + list(self.config['appdata'].keys())))
@@ -116,6 +160,8 @@ class ManageStream(tools.Borg):
             if assignations:
                 [assignations[i].pop('valid', None) for i in assignations]
                 database[process]['assignations'] = assignations
+            if process in self.config['updated']:
+                database[process]['updated'] = self.config['updated'][process]  # Used by the "newest" import policy
         tools.save_json(database, path)
 
     def set_loglevel(self, level=''):
@@ -143,21 +189,38 @@ class ManageStream(tools.Borg):
             self.config['assignations'][process] = self.database[process].get('assignations', {})
         else:
             self.config['appdata'][process] = template
+        self.stamp_process(process)
+        self.config_changed()
+
+    def stamp_process(self, process):
+        self.config['updated'][process] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
 
     def rename_process(self, oldprocess, newprocess):
         try:
             self.config['appdata'][newprocess] = self.config['appdata'].pop(oldprocess)
+            self.config['updated'].pop(oldprocess, None)
+            self.stamp_process(newprocess)
+            self.config_changed()
         except KeyError:
             self.add_process(newprocess)
 
     def remove_process(self, process):
         try:
             self.config['appdata'].pop(process)
+            self.config['updated'].pop(process, None)
+            self.config_changed()
         except KeyError:
             pass
 
+    def config_changed(self):
+        self.config_version += 1
+        self.pathmatchers = {}
+        self.informations = {}
+        self.saveconfig_later()
+
     def create_services(self, force=False):
         if force:
+            self.stop_services()
             self.services = {}
         for service in SERVICES:
             if service not in self.services:
@@ -165,10 +228,19 @@ class ManageStream(tools.Borg):
                 if result:
                     self.services[service] = result
 
+    def stop_services(self):
+        for service in self.services.values():
+            try:
+                service.stop()
+            except Exception as e:
+                logger.exception(e)
+
     def create_service(self, service, config, force=False):
         try:
             if force or config['enabled']:
-                service = SERVICES[service].Main(config)
+                module = SERVICES[service]
+                service = module.Main(config)
+                service.asynchronous = getattr(module, 'AsyncMain', module.AsyncService)(service)
                 logger.info('Created service "{}"'.format(service.name))
                 return service
         except (socket.timeout, SERVICES[service].Timeout):
@@ -186,31 +258,64 @@ class ManageStream(tools.Borg):
             if not self.commandbots.get(name) or force:
                 service.create_commandbot()
 
+    def run_coroutine(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def fanout(self, method, *args, timeout=None):
+        """Call the method on every service concurrently from the event loop, each service is waited for until its own deadline"""
+        return self.run_coroutine(self.gather(method, *args, timeout=timeout))
+
+    async def gather(self, method, *args, timeout=None):
+        services = list(self.services.values())
+        results = await asyncio.gather(*[self.timed(service, method, *args, timeout=timeout) for service in services])
+        results = {service.name: result for service, result in zip(services, results)}
+        logger.debug('{}: {}'.format(method, {k: round(v['time'], 3) for k, v in results.items()}))
+        return results
+
+    async def timed(self, service, method, *args, timeout=None):
+        deadline = timeout or service.get_deadline(method)
+        result = {'result': None, 'error': None, 'timeout': False}
+        start = time.monotonic()
+        # Shielded so that a service running late is reported without being interrupted
+        task = asyncio.ensure_future(getattr(service.asynchronous, method)(*args))
+        try:
+            result['result'] = await asyncio.wait_for(asyncio.shield(task), deadline)
+        except asyncio.TimeoutError:
+            result['timeout'] = True
+            logger.warning('{} for service {} did not finish in {}s'.format(method, service.name, deadline))
+        except Exception as e:
+            result['error'] = e
+            logger.exception(e)
+        result['time'] = time.monotonic() - start
+        return result
+
     def create_clip(self):
-        for service in self.services.values():
-            service.create_clip()
+        return self.fanout('create_clip')
 
     def create_marker(self):
-        for service in self.services.values():
-            service.create_marker()
+        return self.fanout('create_marker')
 
     def update_channel(self, infos):
-        for service in self.services.values():
-            service.update_channel(infos)
+        return self.fanout('update_channel', infos)
 
     def validate_assignations(self, config, category=None):
         if category:
             config.setdefault(category, {})
-        for cat in config:
-            if category and cat != category:
+        for service in self.services.values():
+            if not service.features['category']:
                 continue
-            for service in self.services.values():
-                if service.features['category']:
-                    assigned_category = config.get(cat, {}).get(service.name, {}).get('name', '') or cat
-                    isvalid = config.get(cat, {}).get(service.name, {}).get('valid', None)
-                    if assigned_category and not isvalid:
-                        valid = service.validate_category(assigned_category)
-                        config[cat][service.name] = {'name': assigned_category, 'valid': valid}
+            tovalidate = {}
+            for cat in config:
+                if category and cat != category:
+                    continue
+                assigned_category = config.get(cat, {}).get(service.name, {}).get('name', '') or cat
+                isvalid = config.get(cat, {}).get(service.name, {}).get('valid', None)
+                if assigned_category and not isvalid:
+                    tovalidate[cat] = assigned_category
+            if tovalidate:
+                results = service.validate_categories(list(tovalidate.values())) or {}
+                for cat, assigned_category in tovalidate.items():
+                    config[cat][service.name] = {'name': assigned_category, 'valid': results.get(assigned_category)}
         return config
 
     def is_validcategories(self, category):
@@ -223,11 +328,13 @@ class ManageStream(tools.Borg):
     def get_processfrompath(self, path, platform=None):
         if not platform:
             platform = sys.platform
-        for process, values in self.config['appdata'].items():
-            pathlist = values['path'][platform].lower().split(',')
-            if any(proc in path.lower() for proc in pathlist):
-                return process
-        return ''
+        matcher = self.pathmatchers.get(platform)
+        if matcher is None:
+            patterns = []
+            for process, values in self.config['appdata'].items():
+                patterns += [(i, process) for i in values['path'].get(platform, '').split(',')]
+            matcher = self.pathmatchers[platform] = tools.PathMatcher(patterns)
+        return matcher.match(path)
 
     def check_application(self):
         processpath = tools.getForegroundProcess()
@@ -239,18 +346,27 @@ class ManageStream(tools.Borg):
             self.update_channel(infos)
             self.launch_command(infos['command'])
             self.process = process
+            self.statechanged.notify()
             return infos
 
     def get_informations(self, name):
+        infos = self.informations.get(name)
+        if infos is None:
+            infos = self.informations[name] = self.resolve_informations(name)
+        return {**infos, 'tags': list(infos['tags'])}
+
+    def resolve_informations(self, name):
+        appdata = self.config['appdata'].get(name, {})
+        base = self.config['base']
         infos = {}
-        infos['tags'] = self.config['appdata'].get(name, {}).get('tags', []) + self.config['base'].get('tags', [])
-        infos['title'] = self.config['appdata'].get(name, {}).get('title') or self.config['base'].get('title', '')
-        infos['category'] = self.config['appdata'].get(name, {}).get('category') or self.config['base'].get('category', '')
-        infos['description'] = self.config['appdata'].get(name, {}).get('description') or self.config['base'].get('description', '')
-        infos['command'] = self.config['appdata'].get(name, {}).get('command', '') or self.config['base'].get('command', '')
+        infos['tags'] = appdata.get('tags', []) + base.get('tags', [])
+        infos['title'] = appdata.get('title') or base.get('title', '')
+        infos['category'] = appdata.get('category') or base.get('category', '')
+        infos['description'] = appdata.get('description') or base.get('description', '')
+        infos['command'] = appdata.get('command', '') or base.get('command', '')
         for element in ['title', 'description', 'category', 'tags']:
-            if self.config['base'].get('forced_' + element):
-                infos[element] = self.config['base'].get(element)
+            if base.get('forced_' + element):
+                infos[element] = base.get(element)
         return infos
 
     def launch_command(self, command):
@@ -259,9 +375,29 @@ class ManageStream(tools.Borg):
             subprocess.Popen(command, shell=True)
 
     def update_servicesinfos(self):
-        nb = len(SERVICES) or 1
-        pool = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=nb) as executor:
-            for service in self.services.values():
-                pool.append(executor.submit(service.get_channel_info))
-        concurrent.futures.wait(pool, timeout=5)
+        return self.run_coroutine(self.gather_servicesinfos())
+
+    async def gather_servicesinfos(self):
+        results = await self.gather('get_channel_info', timeout=5)
+        self.infos_updated = time.time()
+        self.check_infoschanged(force=True)  # infos_updated is part of the state too
+        return results
+
+    def check_infoschanged(self, force=False):
+        snapshot = json.dumps({name: service.infos for name, service in self.services.items()}, sort_keys=True, default=str)
+        if force or snapshot != self.infos_snapshot:
+            self.infos_snapshot = snapshot
+            self.statechanged.notify()
+
+    def start_infospoller(self):
+        # Keep the services infos fresh in the background so that readers never wait for the APIs
+        if not self.infospoller:
+            self.infospoller = asyncio.run_coroutine_threadsafe(self.poll_servicesinfos(), self.loop)
+
+    async def poll_servicesinfos(self):
+        while True:
+            try:
+                await self.gather_servicesinfos()
+            except Exception as e:
+                logger.exception(e)
+            await asyncio.sleep(max(5, int(self.config['base'].get('infostimer', 30))))
@@ -1,10 +1,107 @@
+import os
+import gzip
+import glob
 import time
+import json
+import hashlib
+import mimetypes
 import threading
+import concurrent.futures
+from wsgiref.simple_server import WSGIServer
 import lib.bottle as bottle
 import common.manager
 import common.tools
 import logging
 logger = logging.getLogger(__name__)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+THEME = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'theme'))
+
+
+class PooledWSGIServer(WSGIServer):
+    """wsgiref server answering the requests from a pool of threads"""
+    workers = 16
+    pool = None
+
+    def process_request(self, request, client_address):
+        if not self.pool:
+            self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class StaticFiles():
+    """Theme files kept in memory with their compressed variants, reloaded when modified on disk"""
+    compressible = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+    longcache = ('images/',)
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}
+        self.lock = threading.Lock()
+        for path in glob.glob(os.path.join(root, '**', '*'), recursive=True):
+            if os.path.isfile(path) and not path.endswith('.tpl'):
+                self.get(os.path.relpath(path, root).replace(os.sep, '/'))
+
+    def get(self, filename):
+        path = os.path.abspath(os.path.join(self.root, filename))
+        if not path.startswith(self.root + os.sep) or path.endswith('.tpl'):
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self.lock:
+                self.files.pop(filename, None)
+            return None
+        with self.lock:
+            entry = self.files.get(filename)
+        if entry and entry['signature'] == (stat.st_mtime_ns, stat.st_size):
+            return entry
+        entry = self.load(path, filename, (stat.st_mtime_ns, stat.st_size))
+        with self.lock:
+            self.files[filename] = entry
+        return entry
+
+    def load(self, path, filename, signature):
+        with open(path, 'rb') as f:
+            content = f.read()
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        digest = hashlib.sha1(content).hexdigest()[:16]
+        variants = {'identity': content}
+        if mimetype.startswith(self.compressible) and len(content) > 512:
+            variants['gzip'] = gzip.compress(content, 9)
+            if brotli:
+                variants['br'] = brotli.compress(content)
+        etags = {k: '"{}{}"'.format(digest, '' if k == 'identity' else '-' + k) for k in variants}  # Strong ETags differ per encoding
+        cachecontrol = 'public, max-age=86400' if filename.startswith(self.longcache) else 'no-cache'
+        return {'signature': signature, 'mimetype': mimetype, 'variants': variants, 'etags': etags, 'cachecontrol': cachecontrol}
+
+    def response(self, filename):
+        entry = self.get(filename)
+        if not entry:
+            return bottle.HTTPError(404, 'File does not exist.')
+        accepted = bottle.request.headers.get('Accept-Encoding', '')
+        encoding = next((i for i in ('br', 'gzip') if i in entry['variants'] and i in accepted), 'identity')
+        headers = {'ETag': entry['etags'][encoding], 'Cache-Control': entry['cachecontrol'], 'Vary': 'Accept-Encoding'}
+        if headers['ETag'] in bottle.request.headers.get('If-None-Match', ''):
+            return bottle.HTTPResponse(status=304, headers=headers)
+        headers['Content-Type'] = entry['mimetype'] + ('; charset=UTF-8' if entry['mimetype'].startswith('text/') else '')
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        body = entry['variants'][encoding]
+        headers['Content-Length'] = str(len(body))
+        return bottle.HTTPResponse(b'' if bottle.request.method == 'HEAD' else body, headers=headers)
+
 
 # AJAX? Change background color when there is an update?
 
@@ -15,6 +112,11 @@ class WebRemote():
         self.running = False
         self.timer = 1
         self.manager = common.manager.ManageStream()
+        self.boot = int(time.time())  # Keeps the ETags of a previous session from matching
+        self.staticfiles = None
+        self.streaming = True
+        self.streams = None
+        self.templates = {}
         self.port = self.manager.config['base']['port']
 
     def update_infos(self, infos):
@@ -43,6 +145,95 @@ class WebRemote():
     def stop_check(self):
         pass
 
+    def load_theme(self):
+        self.staticfiles = StaticFiles(THEME)
+        for path in glob.glob(os.path.join(THEME, '*.tpl')):
+            name = os.path.splitext(os.path.basename(path))[0]
+            self.templates[name] = bottle.SimpleTemplate(name=name, lookup=[THEME])
+            self.templates[name].co  # Compiles the template now instead of on the first request
+
+    def get_backend(self):
+        server = self.manager.config['base']['server']
+        workers = int(self.manager.config['base']['workers'])
+        if server != 'threaded' and server not in bottle.server_names:
+            logger.error('Unknown web server "{}", using the threaded one instead'.format(server))
+            server = 'threaded'
+        if server == 'threaded':
+            return 'wsgiref', {'server_class': type('PooledWSGIServer', (PooledWSGIServer,), {'workers': workers})}
+        if server in ('cherrypy', 'cheroot'):
+            return server, {'numthreads': workers}
+        return server, {}
+
+    def set_running(self, running):
+        self.running = running
+        self.manager.statechanged.notify()
+
+    def set_checking(self, running):
+        self.set_running(running)
+        if running:
+            self.start_check()
+        else:
+            self.stop_check()
+
+    def get_state(self):
+        services = {s.name: dict(s.infos) for s in list(self.manager.services.values()) if s.config['enabled']}
+        return {'running': self.running, 'process': self.manager.process, 'services': services, 'updated': self.manager.infos_updated}
+
+    def conditional(self, version, content):
+        # The version is read before the content so a concurrent change can only make the ETag older, never newer
+        etag = '"{}-{}"'.format(self.boot, version)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag in bottle.request.headers.get('If-None-Match', ''):
+            return bottle.HTTPResponse(status=304, headers=headers)
+        return bottle.HTTPResponse(json.dumps(content(), default=str), headers={**headers, 'Content-Type': 'application/json'})
+
+    def state_version(self):
+        # Which services are enabled comes from the config
+        return '{}.{}'.format(self.manager.statechanged.version, self.manager.config_version)
+
+    def api(self, app):
+        @app.route('/api/status')
+        def status():
+            return self.conditional(self.state_version(), self.get_state)
+
+        @app.route('/api/services/<name>')
+        def service(name):
+            if name not in self.manager.services:
+                bottle.abort(404, 'Unknown service: {}'.format(name))
+            content = lambda: {'name': name, 'enabled': self.manager.services[name].config['enabled'], 'infos': dict(self.manager.services[name].infos)}
+            return self.conditional(self.state_version(), content)
+
+        @app.route('/api/processes')
+        def processes():
+            return self.conditional(self.manager.config_version, lambda: {'processes': self.manager.config['appdata']})
+
+        @app.route('/api/start', method='POST')
+        def start():
+            self.set_checking(True)
+            return self.get_state()
+
+        @app.route('/api/stop', method='POST')
+        def stop():
+            self.set_checking(False)
+            return self.get_state()
+
+    def stream_events(self):
+        # Each stream holds a server thread until the client disconnects, its slot is released when the server closes the generator
+        state = {}
+        version = None
+        try:
+            while True:
+                version = self.manager.statechanged.wait(version, timeout=15)
+                newstate = json.loads(json.dumps(self.get_state(), default=str))
+                diff = common.tools.diff_dict(state, newstate)
+                state = newstate
+                if diff:
+                    yield 'data: {}\n\n'.format(json.dumps(diff))
+                else:
+                    yield ': keepalive\n\n'  # Also detects the disconnected clients
+        finally:
+            self.streams.release()
+
     def server(self):
         app = bottle.Bottle()
 
@@ -50,28 +241,34 @@ class WebRemote():
         def strip_path():
             bottle.request.environ['PATH_INFO'] = bottle.request.environ['PATH_INFO'].rstrip('/')
 
+        self.api(app)  # Before the static files catch-all which would shadow the dynamic routes
+
         @app.route('/<filename:path>')
         def staticfiles(filename):
-            return bottle.static_file(filename, root='data/theme/')
+            return self.staticfiles.response(filename)
 
         @app.route('/')
         def index():
-            self.manager.update_servicesinfos()
             action = 'STOP' if self.running else 'START'
             services = {s.name: {'enabled': s.config['enabled'], 'infos': s.infos} for s in self.manager.services.values()}
-            return bottle.template('data/theme/remote.tpl', action=action, services=services, refresh=int(self.manager.config['base']['reload']))
+            age = int(time.time() - self.manager.infos_updated) if self.manager.infos_updated else None
+            return self.templates['remote'].render(action=action, services=services, refresh=int(self.manager.config['base']['reload']), age=age, updated=self.manager.infos_updated, process=self.manager.process)
 
         @app.route('/', method="POST")
         def formhandler():
-            action = bottle.request.forms.get('action')
-            if action == 'START':
-                self.running = True
-                self.start_check()
-            else:
-                self.running = False
-                self.stop_check()
+            self.set_checking(bottle.request.forms.get('action') == 'START')
             bottle.redirect('/')
 
+        @app.route('/events')
+        def events():
+            if not self.streaming or not self.streams.acquire(blocking=False):
+                # Tells EventSource to stop reconnecting, the page falls back to reloading itself
+                bottle.response.status = 204
+                return ''
+            bottle.response.content_type = 'text/event-stream'
+            bottle.response.set_header('Cache-Control', 'no-cache')
+            return self.stream_events()
+
         @app.route('/update_title', method='POST')
         def update_title():
             infos = {'title': bottle.request.forms.title, 'category': bottle.request.forms.category}
@@ -81,6 +278,7 @@ class WebRemote():
                 service.update_channel(infos)
                 infos = service.get_channel_info()
                 infos = {servicename: infos}
+                self.manager.check_infoschanged()
             else:
                 self.manager.update_channel(infos)
                 self.manager.update_servicesinfos()
@@ -93,8 +291,17 @@ class WebRemote():
             category = bottle.request.forms.category
             servicename = bottle.request.forms.service
             service = self.manager.services[servicename]
-            categories = service.query_category(category)
+            categories = service.autocomplete(category, client=bottle.request.remote_addr) or {}
             categories = {k: k for k, v in categories.items()}
             return categories
 
-        app.run(host='0.0.0.0', port=self.port, quiet=False, server='cherrypy')
+        @app.route('/query_game', method='POST')
+        def query_game():
+            return {'games': self.manager.database.search(bottle.request.forms.category, limit=10)}
+
+        self.load_theme()
+        self.manager.start_infospoller()
+        server, options = self.get_backend()
+        self.streaming = server != 'wsgiref' or 'server_class' in options
+        self.streams = threading.BoundedSemaphore(max(1, int(self.manager.config['base']['workers']) // 2))  # Keeps half the threads for the other routes
+        app.run(host=self.manager.config['base']['host'], port=self.port, quiet=False, server=server, **options)
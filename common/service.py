@@ -1,16 +1,25 @@
 # coding: utf-8
+import os
 import re
+import sys
 import copy
+import json
 import time
 import socket
+import threading
 import urllib
-import inspect
+import asyncio
+import functools
 import logging
 import requests
 import webbrowser
 
 from requests_oauthlib import OAuth2Session
 from oauthlib.oauth2.rfc6749.errors import InvalidGrantError, MissingTokenError, InvalidClientError, InvalidTokenError, InvalidClientIdError
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
 import common.manager
 import common.tools as tools
@@ -24,11 +33,16 @@ class Timeout(Exception):
 class Service():
     def __init__(self, config):
         self.config = config
+        self.tokenlock = threading.Lock()
         self.conform_config()
         self.infos = {'online': '', 'title': '', 'name': '', 'category': '', 'viewers': ''}
         self.manager = common.manager.ManageStream()
+        self.session = requests.Session()
         self.oauth2 = OAuth2Session(token=self.config['authorization'], client_id=self.config['client_id'], scope=self.config['scope'], redirect_uri=self.config['redirect_uri'])
+        self.autocomplete = tools.Autocompleter(self.query_category)
+        self.mount_adapters()
         self.get_token()
+        self.create_datasets()
         self.get_channel_id()
         self.create_commandbot()
 
@@ -51,6 +65,12 @@ class Service():
             "client_secret": ''
         }
 
+    def mount_adapters(self):
+        poolsize = int(self.manager.config['base'].get('poolsize', 4))
+        retries = int(self.manager.config['base'].get('retries', 2))
+        for session in [self.session, self.oauth2]:
+            tools.mount_adapters(session, poolsize, retries)
+
     def set_headers(self):
         self.headers = {
             'Client-ID': self.config['client_id'],
@@ -65,6 +85,10 @@ class Service():
         return time.time() > self.config['authorization']['expires_at']
 
     def get_token(self):
+        with self.tokenlock:  # Concurrent refreshes would start parallel authorization flows
+            self.authorize()
+
+    def authorize(self):
         try:
             if self.token_isexpired():
                 self.refresh_token()
@@ -107,12 +131,24 @@ class Service():
             logger.warning("Couldn't refresh the token")
             raise
 
+    def get_deadline(self, method):
+        return int(self.manager.config['base']['timeout']) + int(self.config.get('delay') or 0)
+
     def query_category(self, category):
         return {}
 
     def validate_category(self, category):
         return None
 
+    def validate_categories(self, categories):
+        return {category: self.validate_category(category) for category in categories}
+
+    def get_cachedcategory(self, category):
+        return self.manager.categories.get(self.name, category)
+
+    def cache_category(self, category, valid, categoryid=None):
+        self.manager.categories.set(self.name, category, valid=valid, id=categoryid)
+
     def create_clip(self):
         return None
 
@@ -122,6 +158,21 @@ class Service():
     def create_commandbot(self):
         return None
 
+    def stop(self):
+        self.stop_datasets()
+        if getattr(self, 'asynchronous', None):
+            self.manager.run_coroutine(self.asynchronous.close(), timeout=5)
+
+    def create_datasets(self):
+        return None
+
+    def stop_datasets(self):
+        for dataset in [i for i in vars(self).values() if isinstance(i, tools.Dataset)]:
+            dataset.stop()
+
+    def get_cachepath(self, name):
+        return os.path.join(os.path.dirname(self.manager.config_filepath), 'cache', '{}_{}.json'.format(self.name.lower(), name))
+
     def update_channel(self, infos):
         self.get_token()
         infos = copy.deepcopy(infos)
@@ -131,16 +182,20 @@ class Service():
             infos['category'] = self.manager.config.get('assignations', {}).get(infos['category'], {}).get(self.name, {}).get('name', infos.get('category'))
         return infos
 
-    def request(self, action, address, headers=None, data=None, params=None):
-        if not tools.internet():
+    def request(self, action, address, headers=None, data=None, params=None, operation=None):
+        if not tools.connectivity.is_online():
             raise tools.NoInternet()
         if not headers:
             headers = self.headers
-        action = getattr(requests, action)
-        response = action(address, headers=headers, json=data, params=params)
-        curframe = inspect.currentframe()
-        outframe = inspect.getouterframes(curframe, 2)[1][3]
-        self.log_requests(outframe, address, response)
+        try:
+            response = self.session.request(action, address, headers=headers, json=data, params=params)
+        except requests.ConnectionError:
+            tools.connectivity.set_state(False)
+            raise
+        tools.connectivity.set_state(True)
+        if operation is None and (not response or logger.isEnabledFor(logging.DEBUG)):
+            operation = sys._getframe(1).f_code.co_name  # Only pay for the caller lookup when it will be logged
+        self.log_requests(operation, address, response)
         return response
 
     def log_requests(self, action, address, response):
@@ -150,7 +205,87 @@ class Service():
                 self.get_token()
             elif not response:
                 logger.error('{} - {}: {} {}'.format(action, self.name, address, response.json()))
-            else:
+            elif logger.isEnabledFor(logging.DEBUG):
                 logger.debug('{} - {}: {}'.format(action, self.name, response.json()))
         except:
             logger.info(response)  # Some reponse return an empty JSON
+
+
+class AsyncResponse():
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def __bool__(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncService():
+    """Asynchronous counterpart of a Service, driven by the manager event loop.
+    Methods without a native implementation run the blocking ones in the manager executor."""
+    def __init__(self, service):
+        self.service = service
+        self.name = service.name
+        self.config = service.config
+        self.manager = service.manager
+        self.session = None
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.manager.executor, functools.partial(func, *args))
+
+    def get_session(self):
+        if not self.session:
+            poolsize = int(self.manager.config['base'].get('poolsize', 4))
+            timeout = aiohttp.ClientTimeout(total=int(self.manager.config['base']['timeout']))
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=poolsize), timeout=timeout)
+        return self.session
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def request(self, action, address, headers=None, data=None, params=None, operation=None):
+        if operation is None:
+            operation = sys._getframe(1).f_code.co_name
+        if aiohttp is None:
+            return await self.run(self.service.request, action, address, headers, data, params, operation)
+        online = tools.connectivity.cached()
+        if online is None:
+            online = await self.run(tools.connectivity.is_online)  # Only the actual probe needs a thread
+        if not online:
+            raise tools.NoInternet()
+        try:
+            async with self.get_session().request(action.upper(), address, headers=headers or self.service.headers, json=data, params=params) as result:
+                response = AsyncResponse(result.status, await result.read())
+        except aiohttp.ClientConnectionError:
+            tools.connectivity.set_state(False)
+            raise
+        tools.connectivity.set_state(True)
+        if response.status_code == 401:
+            await self.run(self.service.log_requests, operation, address, response)  # Can block to ask for a new token
+        else:
+            self.service.log_requests(operation, address, response)
+        return response
+
+    async def prepare_update(self, infos):
+        return await self.run(Service.update_channel, self.service, infos)
+
+    async def get_channel_info(self):
+        return await self.run(self.service.get_channel_info)
+
+    async def query_category(self, category):
+        return await self.run(self.service.query_category, category)
+
+    async def update_channel(self, infos):
+        return await self.run(self.service.update_channel, infos)
+
+    async def create_clip(self):
+        return await self.run(self.service.create_clip)
+
+    async def create_marker(self):
+        return await self.run(self.service.create_marker)
@@ -3,6 +3,8 @@ import os
 import sys
 import glob
 import json
+import time
+import asyncio
 import socket
 import shutil
 import ctypes
@@ -13,11 +15,14 @@ import traceback
 import functools
 import threading
 import subprocess
+import concurrent.futures
 from io import BytesIO
 from zipfile import ZipFile
 
 import psutil
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from contextlib import contextmanager
 logger = logging.getLogger(__name__)
 
@@ -32,13 +37,52 @@ def internet(host="8.8.8.8", port=53, timeout=3):
   Service: domain (DNS/TCP)
   """
   try:
-    socket.setdefaulttimeout(timeout)
-    socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((host, port))
+    socket.create_connection((host, port), timeout=timeout).close()
     return True
   except socket.error as ex:
     logger.exception(ex)
     return False
 
+
+class Connectivity():
+    """Cache the reachability of the network, real requests update it passively"""
+    def __init__(self, ttl=60, offline_ttl=5):
+        self.ttl = ttl
+        self.offline_ttl = offline_ttl
+        self.online = None
+        self.checked = 0
+        self.lock = threading.Lock()
+
+    def set_state(self, online):
+        with self.lock:
+            self.online = online
+            self.checked = time.monotonic()
+
+    def cached(self):
+        # None when the state is unknown or too old to be trusted
+        with self.lock:
+            ttl = self.ttl if self.online else self.offline_ttl
+            if self.online is not None and time.monotonic() - self.checked < ttl:
+                return self.online
+        return None
+
+    def is_online(self):
+        online = self.cached()
+        if online is None:
+            online = internet()
+            self.set_state(online)
+        return online
+
+connectivity = Connectivity()
+
+def mount_adapters(session, poolsize=4, retries=2):
+    # Keep-alive connections are reused between calls, only idempotent requests are retried
+    retry = Retry(total=retries, connect=retries, read=retries, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=poolsize, pool_maxsize=poolsize, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 @contextmanager
 def pause_services(services):
     if sys.platform=='win32':
@@ -101,6 +145,12 @@ def decorate_all_methods(decorator, exclude=None):
         return cls
     return decorate
 
+def start_eventloop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    return loop
+
 def threaded(func):
     @functools.wraps(func)
     def async_func(*args, **kwargs):
@@ -131,20 +181,167 @@ def getForegroundProcess():
         import AppKit
         return str(AppKit.NSWorkspace.sharedWorkspace().activeApplication()['NSApplicationPath'])
     elif sys.platform in ['linux', 'linux2']:
-        root = subprocess.Popen(['xprop', '-root', '_NET_ACTIVE_WINDOW'], stdout=subprocess.PIPE)
-        stdout, _ = root.communicate()
-        m = re.search(b'^_NET_ACTIVE_WINDOW.* ([\w]+)$', stdout)
-        if m != None:
-            window_id = m.group(1)
-            window = subprocess.Popen(['xprop', '-id', window_id, 'WM_NAME'], stdout=subprocess.PIPE)
-            stdout, _ = window.communicate()
-        else:
-            return ''
-        match = re.match(b"WM_NAME\(\w+\) = (?P<name>.+)$", stdout)
-        if match != None:
-            return match.group("name").strip(b'"')
+        if X11Display.is_available():
+            return x11display.get_foregroundpath()
+        return get_foregroundpath_xprop()
     return ''
 
+def get_foregroundpath_xprop():
+    root = subprocess.Popen(['xprop', '-root', '_NET_ACTIVE_WINDOW'], stdout=subprocess.PIPE)
+    stdout, _ = root.communicate()
+    m = re.search(rb'^_NET_ACTIVE_WINDOW.* ([\w]+)$', stdout)
+    if m != None:
+        window_id = m.group(1)
+        window = subprocess.Popen(['xprop', '-id', window_id, '_NET_WM_PID'], stdout=subprocess.PIPE)
+        stdout, _ = window.communicate()
+    else:
+        return ''
+    match = re.match(rb"_NET_WM_PID\(\w+\) = (?P<pid>\d+)", stdout)
+    if match != None:
+        return get_processpath(int(match.group("pid")))
+    return ''
+
+def get_processpath(pid):
+    try:
+        return psutil.Process(pid).exe()
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+        return ''
+
+
+class X11Display():
+    """Keep a single X11 connection open to resolve the foreground window without spawning xprop"""
+    def __init__(self):
+        self.display = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_available():
+        if not os.environ.get('DISPLAY'):
+            return False
+        try:
+            import Xlib.display
+            return True
+        except ImportError:
+            return False
+
+    def connect(self):
+        from Xlib import display
+        self.display = display.Display()
+        self.root = self.display.screen().root
+        self.atom_active = self.display.intern_atom('_NET_ACTIVE_WINDOW')
+        self.atom_pid = self.display.intern_atom('_NET_WM_PID')
+
+    def get_foregroundpath(self):
+        from Xlib import X, error
+        with self.lock:
+            try:
+                if not self.display:
+                    self.connect()
+                active = self.root.get_full_property(self.atom_active, X.AnyPropertyType)
+                if not active or not active.value[0]:
+                    return ''
+                window = self.display.create_resource_object('window', active.value[0])
+                pid = window.get_full_property(self.atom_pid, X.AnyPropertyType)
+            except error.XError:
+                return ''
+            except (error.ConnectionClosedError, OSError):
+                self.display = None
+                return ''
+        if not pid:
+            return ''
+        return get_processpath(int(pid.value[0]))
+
+x11display = X11Display()
+
+
+class ForegroundWatcher(threading.Thread):
+    """Call the callback each time the active window changes, only available on X11 with python-xlib"""
+    def __init__(self, callback):
+        super().__init__(daemon=True)
+        self.callback = callback
+        self.running = False
+
+    @staticmethod
+    def is_available():
+        return sys.platform in ['linux', 'linux2'] and X11Display.is_available()
+
+    def run(self):
+        import select
+        from Xlib import X, display
+        self.running = True
+        disp = display.Display()
+        try:
+            root = disp.screen().root
+            active = disp.intern_atom('_NET_ACTIVE_WINDOW')
+            root.change_attributes(event_mask=X.PropertyChangeMask)
+            disp.flush()
+            while self.running:
+                select.select([disp], [], [], 1)
+                changed = False
+                for _ in range(disp.pending_events()):
+                    event = disp.next_event()
+                    if event.type == X.PropertyNotify and event.atom == active:
+                        changed = True
+                if changed:
+                    self.callback()
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            disp.close()
+
+    def stop(self):
+        self.running = False
+
+
+class PathMatcher():
+    """Aho-Corasick automaton finding which registered patterns are contained in a path in a single pass"""
+    def __init__(self, patterns):
+        # patterns: list of (pattern, value), on multiple matches the value registered first wins
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]
+        for rank, (pattern, value) in enumerate(patterns):
+            pattern = pattern.strip().lower()
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            if self.output[node] is None or rank < self.output[node][0]:
+                self.output[node] = (rank, value)
+        self.build_failures()
+
+    def build_failures(self):
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0) if self.goto[fallback].get(char) != child else 0
+                inherited = self.output[self.fail[child]]
+                if inherited and (self.output[child] is None or inherited[0] < self.output[child][0]):
+                    self.output[child] = inherited
+
+    def match(self, path, default=''):
+        best = None
+        node = 0
+        for char in path.lower():
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            found = self.output[node]
+            if found and (best is None or found[0] < best[0]):
+                best = found
+        return best[1] if best else default
+
+
 def listservices(namefilter='', status=''):
     if sys.platform != 'win32':
         return {}
@@ -193,6 +390,21 @@ def merge_dict(d1, d2):
         else:
             d1[k] = d2[k]
 
+def diff_dict(old, new):
+    # Keys of new that are different from old, removed keys are set to None
+    diff = {}
+    for key, value in new.items():
+        if isinstance(value, dict) and isinstance(old.get(key), dict):
+            subdiff = diff_dict(old[key], value)
+            if subdiff:
+                diff[key] = subdiff
+        elif key not in old or old[key] != value:
+            diff[key] = value
+    for key in old:
+        if key not in new:
+            diff[key] = None
+    return diff
+
 def load_json(path, backup=True):
     content = {}
     try:
@@ -210,11 +422,286 @@ def load_json(path, backup=True):
 def save_json(data, path):
     if not path.endswith('.json'):
         path = path + ('.json')
-    with tempfile.NamedTemporaryFile('w', delete=False) as tmp:
-        json.dump(data, tmp, indent=4)
-    shutil.move(tmp.name, path)
+    return save_file(json.dumps(data, indent=4), path)
+
+def save_file(content, path):
+    # The temporary file is created next to the target so the final rename stays atomic
+    if isinstance(content, str):
+        content = [content]
+    folder = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('w', dir=folder, prefix='.' + os.path.basename(path), suffix='.tmp', delete=False) as tmp:
+        try:
+            for chunk in content:
+                tmp.write(chunk)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    os.replace(tmp.name, path)
     return True
 
+
+def iter_json_items(path, chunksize=65536):
+    """Yield the (key, value) pairs of the top level JSON object of a file without loading the whole file"""
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r'\s*')
+    with open(path, encoding='utf-8') as f:
+        buffer = ''
+        position = 0
+        eof = False
+
+        def parse(position, func):
+            # Read more of the file until the next token is complete
+            nonlocal buffer, eof
+            while True:
+                position = whitespace.match(buffer, position).end()
+                try:
+                    result, end = func(position)
+                    if end < len(buffer) or eof:
+                        return result, end
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                except IndexError:
+                    if eof:
+                        raise json.JSONDecodeError('Unexpected end of file', buffer, position) from None
+                chunk = f.read(chunksize)
+                eof = not chunk
+                buffer += chunk
+
+        def char(position):
+            if position >= len(buffer):
+                raise IndexError
+            return buffer[position], position + 1
+
+        def value(position):
+            return decoder.raw_decode(buffer, position)
+
+        token, position = parse(position, char)
+        if token != '{':
+            raise json.JSONDecodeError('Expecting a JSON object', buffer, position)
+        while True:
+            token, end = parse(position, char)
+            if token == '}':
+                return
+            key, position = parse(position, value)
+            token, position = parse(position, char)
+            if token != ':':
+                raise json.JSONDecodeError("Expecting ':' delimiter", buffer, position)
+            item, position = parse(position, value)
+            yield key, item
+            token, position = parse(position, char)
+            if token == '}':
+                return
+            if token != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position)
+            buffer = buffer[position:]  # Only keep what has not been parsed yet
+            position = 0
+
+
+class PersistentCache():
+    """Two levels dictionary saved on disk where entries expire after the ttl in seconds"""
+    def __init__(self, path, ttl=604800):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = load_json(path, backup=False) or {}
+        self.save_later = Debouncer(self.save, daemon=False)  # Pending writes are finished before exiting
+
+    def get(self, section, key):
+        with self.lock:
+            entry = self.data.get(section, {}).get(key)
+        if entry and time.time() - entry.get('time', 0) < self.ttl:
+            return entry
+        return None
+
+    def set(self, section, key, **values):
+        with self.lock:
+            self.data.setdefault(section, {})[key] = {**values, 'time': time.time()}
+        self.save_later()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock:
+            content = json.dumps(self.data)
+        return save_file(content, self.path)
+
+
+class Dataset():
+    """Data loaded from a disk snapshot at startup and refreshed in the background every interval in seconds,
+    a failed refresh is tried again after the retry delay"""
+    def __init__(self, path, fetch, interval=86400, retry=300):
+        self.path = path
+        self.fetch = fetch
+        self.interval = interval
+        self.retry = retry
+        self.attempted = 0
+        self.stopped = False
+        self.timer = None
+        self.loaded = threading.Event()
+        snapshot = load_json(path, backup=False) or {}
+        self.data = snapshot.get('data') or {}
+        self.updated = snapshot.get('time', 0)
+        if self.data:
+            self.loaded.set()
+
+    def start(self):
+        self.stopped = False
+        delay = max(0, self.updated + self.interval - time.time(), self.attempted + self.retry - time.time())
+        self.timer = threading.Timer(delay, self.refresh)
+        self.timer.daemon = True
+        self.timer.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        if self.timer:
+            self.timer.cancel()
+
+    def refresh(self):
+        self.attempted = time.time()
+        try:
+            data = self.fetch()
+            if data:
+                self.data = data
+                self.updated = time.time()
+                self.loaded.set()
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                save_file(json.dumps({'time': self.updated, 'data': data}), self.path)
+        finally:
+            if not self.stopped:
+                self.start()
+
+    def wait(self, timeout=None):
+        # Only blocks when there was no snapshot and the first refresh is still running
+        self.loaded.wait(timeout)
+        return self.data
+
+
+class BidirectionalMap(dict):
+    """Dictionary with a reverse lookup of keys by value, not meant to be modified after creation"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.inverse = {v: k for k, v in self.items()}
+
+    def key(self, value, default=None):
+        return self.inverse.get(value, default)
+
+
+class Autocompleter():
+    """Shared front of a search function: identical queries in flight are only sent once, longer queries are answered
+    from the results of a shorter one when they were complete, and a client typing faster than the delay only sends its last query"""
+    def __init__(self, query, limit=10, pagesize=20, delay=0.3, ttl=300, maxsize=256):
+        self.query = query
+        self.limit = limit
+        self.pagesize = pagesize  # Less results than that means the search returned everything matching
+        self.delay = delay
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.cache = {}
+        self.pending = {}
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, text, client=None):
+        text = text.strip()
+        key = text.casefold()
+        if not key:
+            return {}
+        with self.lock:
+            if client is not None:
+                self.clients[client] = key
+            result = self.cached(key)
+        if result is None and client is not None:
+            time.sleep(self.delay)
+        with self.lock:
+            if client is not None and self.clients.get(client) != key:
+                return None  # Superseded by a newer query of the same client
+            result = self.cached(key) if result is None else result
+            future = self.pending.get(key)
+            owner = result is None and future is None
+            if owner:
+                future = self.pending[key] = concurrent.futures.Future()
+        if result is not None:
+            return self.rank(result, key)
+        if not owner:
+            return self.rank(future.result(), key)
+        try:
+            result = self.query(text) or {}
+            with self.lock:
+                if result:  # Failed lookups return nothing and are not worth keeping
+                    self.cache[key] = (time.time(), result)
+                if len(self.cache) > self.maxsize:
+                    self.cache.pop(next(iter(self.cache)))
+            future.set_result(result)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        return self.rank(result, key)
+
+    def cached(self, key):
+        for i in range(len(key), 0, -1):
+            timestamp, result = self.cache.get(key[:i], (0, None))
+            if time.time() - timestamp > self.ttl:
+                continue
+            if i == len(key):
+                return result
+            filtered = {k: v for k, v in result.items() if key in k.casefold()}
+            if len(result) < self.pagesize or len(filtered) >= self.limit:
+                return filtered
+            return None
+        return None
+
+    def rank(self, result, key):
+        names = sorted(result, key=lambda i: key not in i.casefold())  # Stable, keeps the order of the service otherwise
+        return {i: result[i] for i in names[:self.limit]}
+
+
+class ChangeNotifier():
+    """Version counter that other threads can wait on until it changes"""
+    def __init__(self):
+        self.version = 0
+        self.condition = threading.Condition()
+
+    def notify(self):
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(self, version, timeout=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+class Debouncer():
+    """Coalesce multiple calls happening during the delay into a single call of the function"""
+    def __init__(self, func, delay=2, daemon=True):
+        self.func = func
+        self.delay = delay
+        self.daemon = daemon
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self.func)
+            self.timer.daemon = self.daemon
+            self.timer.start()
+
+    def cancel(self):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+
 class Borg:
     __shared_state = {}
     def __init__(self):
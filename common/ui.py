@@ -84,14 +84,63 @@ class LogPanel(QtWidgets.QDockWidget):
         logging.getLogger().addHandler(self.handler)
 
 
+class DatabaseCompleter(QtWidgets.QCompleter):
+    fuzzyfound = QtCore.Signal(str, list)
+
+    def __init__(self, database, parent=None, limit=20):
+        super().__init__(parent)
+        self.database = database
+        self.limit = limit
+        self.text = ''
+        self.stringmodel = QtCore.QStringListModel()
+        self.setModel(self.stringmodel)
+        self.setCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        self.setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
+        # The fuzzy pass is only started once the user stops typing
+        self.fuzzytimer = QtCore.QTimer(self)
+        self.fuzzytimer.setSingleShot(True)
+        self.fuzzytimer.setInterval(250)
+        self.fuzzytimer.timeout.connect(self.start_fuzzy)
+        self.fuzzyfound.connect(self.add_fuzzy)
+
+    def set_lineedit(self, lineedit):
+        lineedit.setCompleter(self)
+        lineedit.textEdited.connect(self.update_model)
+
+    def update_model(self, text):
+        self.text = text
+        self.fuzzytimer.stop()
+        result = self.database.prefix(text, self.limit) if text else []
+        self.stringmodel.setStringList(result)
+        if text:
+            self.complete()
+            if len(result) < self.limit:
+                self.fuzzytimer.start()
+
+    def start_fuzzy(self):
+        self.fuzzy(self.text)
+
+    @common.tools.threaded
+    def fuzzy(self, text):
+        self.fuzzyfound.emit(text, self.database.fuzzy(text, self.limit))
+
+    def add_fuzzy(self, text, names):
+        if text != self.text:
+            return  # The user kept typing
+        current = self.stringmodel.stringList()
+        result = current + [i for i in names if i not in current][:self.limit - len(current)]
+        if result != current:
+            self.stringmodel.setStringList(result)
+            self.complete()
+
+
 class DialogAddProcess(QtWidgets.QDialog):
     def __init__(self, database, parent=None):
         super().__init__(parent)
-        self.completer = QtWidgets.QCompleter(list(database.keys()))
-        self.completer.setCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        self.completer = DatabaseCompleter(database)
         self.linedit = QtWidgets.QLineEdit()
         self.linedit.setMinimumWidth(200)
-        self.linedit.setCompleter(self.completer)
+        self.completer.set_lineedit(self.linedit)
         self.buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
         self.layout = QtWidgets.QVBoxLayout()
         self.layout.addWidget(self.linedit)
@@ -121,9 +170,8 @@ class StreamManager_UI(common.systray.Window):
         self.log_panel.changed_loglevel.connect(self.set_loglevel)
         self.manager = ManagerStreamThread()
         self.manager.create_services()
-        self.manager.createdservices.connect(self.updated)
+        self.manager.createdservices.connect(self.reload)
         self.manager.validate.connect(self.update_invalidcategory)
-        self.manager.updated.connect(self.updated)
         self.webremote = WebRemote(self.manager.config['base']['autostart'])
         self.webremote.startedcheck.connect(self.start_check)
         self.webremote.stoppedcheck.connect(self.stop_check)
@@ -238,9 +286,6 @@ class StreamManager_UI(common.systray.Window):
     def stop_check(self):
         self.manager.quit()
 
-    def updated(self, infos=None):
-        self.reload()
-
     def reload(self):
         self.panel_status['webpage'].reload()
 
@@ -360,9 +405,8 @@ class StreamManager_UI(common.systray.Window):
         self.gameslayout['category'] = LineEdit(icons)
         self.gameslayout['category'].setToolTip('Category')
         self.gameslayout['category'].editingFinished.connect(functools.partial(self.save_appdata, validate=True))
-        self.completer = QtWidgets.QCompleter(list(self.manager.database.keys()))
-        self.completer.setCaseSensitivity(QtCore.Qt.CaseInsensitive)
-        self.gameslayout['category'].setCompleter(self.completer)
+        self.completer = DatabaseCompleter(self.manager.database)
+        self.completer.set_lineedit(self.gameslayout['category'])
         self.gameslayout['category_layout'].addWidget(self.gameslayout['category_conflicts'])
         self.gameslayout['category_layout'].addWidget(self.gameslayout['category'])
         self.gameslayout['rlayout'].addRow('Category:', self.gameslayout['category_layout'])
@@ -468,7 +512,10 @@ class StreamManager_UI(common.systray.Window):
     def import_database(self):
         path = self.create_filedialog(action='open')
         if path:
-            self.manager.import_database(path)
+            policies = {'Imported entries replace mine': 'remote', 'Keep my entries': 'local', 'Most recently updated entries win': 'newest'}
+            choice, ok = QtWidgets.QInputDialog.getItem(self, 'Import Game Database', 'On conflicts:', list(policies), 0, False)
+            if ok:
+                common.tools.threaded(self.manager.import_database)(path, policies[choice])
 
     def export_database(self):
         path = self.create_filedialog(action='save')
@@ -489,11 +536,14 @@ class StreamManager_UI(common.systray.Window):
         if current and current.text():
             self.manager.config['appdata'][current.text()].update(data)
             self.manager.config['appdata'][current.text()]['path'][sys.platform] = self.gameslayout['stacked_processpath'].text()
+            self.manager.stamp_process(current.text())
+            self.manager.config_changed()
             self.update_gamerow(current)
         elif not current:
             for key in data.copy():
                 data['forced_' + key] = self.gameslayout[key].button.state
                 self.manager.config['base'].update(data)
+            self.manager.config_changed()
         self.manager.process = ''  # Reset current process to be able to apply new settings
         logger.debug(data)
 
@@ -604,8 +654,8 @@ class StreamManager_UI(common.systray.Window):
         if init:
             QtWidgets.QShortcut(QtGui.QKeySequence("F11"), self, self.mouseDoubleClickEvent)
             QtWidgets.QShortcut(QtGui.QKeySequence("F5"), self, self.reload)
-        keyboard.add_hotkey(self.manager.config['shortcuts']['create_clip'], self.manager.create_clip)
-        keyboard.add_hotkey(self.manager.config['shortcuts']['create_marker'], self.manager.create_marker)
+        keyboard.add_hotkey(self.manager.config['shortcuts']['create_clip'], common.tools.threaded(self.manager.create_clip))
+        keyboard.add_hotkey(self.manager.config['shortcuts']['create_marker'], common.tools.threaded(self.manager.create_marker))
 
     def create_statuslayout(self):
         self.panel_status = {}
@@ -629,6 +679,7 @@ class Preferences(QtWidgets.QDialog):
 
     def __init__(self, manager, parent=None):
         super().__init__(parent)
+        self.manager = manager
         self.tabs = QtWidgets.QTabWidget()
         self.tab_general = Preferences_General(manager)
         self.tab_streams = Preferences_Streams(manager)
@@ -666,6 +717,7 @@ class Preferences(QtWidgets.QDialog):
         self.tab_pauseservices.accept()
         self.tab_pauseprocesses.accept()
         self.tab_assignations.accept()
+        self.manager.config_changed()
         self.updated.emit()
         super().accept()
 
@@ -698,7 +750,7 @@ class Preferences_General(QtWidgets.QWidget):
         self.interface['label_autostart'] = QtWidgets.QLabel('Automatically start the check')
         self.interface['label_starttray'] = QtWidgets.QLabel('Automatically start minimised to the tray icon')
         self.interface['label_checktimer'] = QtWidgets.QLabel('Check the foreground process every (x) seconds')
-        self.interface['label_reload'] = QtWidgets.QLabel('Reload the status webpage every (x) minutes')
+        self.interface['label_reload'] = QtWidgets.QLabel('Without live updates, reload the status webpage every (x) minutes')
         self.interface['label_timeout'] = QtWidgets.QLabel('Number of seconds before the token creation timeouts')
         self.interface['label_port'] = QtWidgets.QLabel('Port to use for the webremote (needs a restart)')
         self.interface['checktimer'].setMinimum(1)
@@ -815,7 +867,7 @@ class Preferences_Assignations(QtWidgets.QDialog):
         # Add a QTimer to prevent lag
         service = self.manager.services.get(service)
         if service:
-            autocompletion = service.query_category(text)
+            autocompletion = service.autocomplete(text)
             self.interface['completer'] = QtWidgets.QCompleter(list(autocompletion.keys()))
             self.interface['completer'].setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
             self.interface['completer'].activated.connect(functools.partial(self.set_validautocomplete, service.name))  # If activated() then validated automatically
@@ -865,6 +917,8 @@ class Preferences_Assignations(QtWidgets.QDialog):
 
     def accept(self):
         assignations = self.manager.validate_assignations(self.temporary_settings)
+        for process in [i for i in assignations if assignations[i] != self.manager.config['assignations'].get(i)]:
+            self.manager.stamp_process(process)
         self.manager.config['assignations'] = assignations
 
     def reset(self):
@@ -1367,6 +1421,14 @@ class ManagerStreamThread(common.manager.ManageStream, QtCore.QThread):
     validate = QtCore.Signal(str)
     updated = QtCore.Signal(dict)
     createdservices = QtCore.Signal()
+    foregroundchanged = QtCore.Signal()
+    saveconfig = QtCore.Signal()
+
+    def __init__(self):
+        super().__init__()
+        # The debounced save runs on a timer thread, hand it to the thread owning the config instead
+        self.saveconfig.connect(self.save_config)
+        self.saveconfig_later.func = self.saveconfig.emit
 
     def run(self):
         with common.tools.pause_processes(self.config['base']['processes']):
@@ -1374,8 +1436,17 @@ class ManagerStreamThread(common.manager.ManageStream, QtCore.QThread):
                 self.create_services()
                 self.checktimer = QtCore.QTimer()
                 self.checktimer.timeout.connect(self.main)
-                self.checktimer.start(int(self.config['base']['checktimer']) * 1000)
+                self.checktimer.start(int(self.config['base']['checktimer']) * 1000)  # Still polling in case the watcher stops
+                if common.tools.ForegroundWatcher.is_available():
+                    self.foregroundchanged.connect(self.main)
+                    self.watcher = common.tools.ForegroundWatcher(self.foregroundchanged.emit)
+                    self.watcher.start()
+                    self.foregroundchanged.emit()
                 self.exec_()
+                if getattr(self, 'watcher', None):
+                    self.watcher.stop()
+                    self.foregroundchanged.disconnect(self.main)
+                    self.watcher = None
 
     def main(self):
         self.create_commandbots()
@@ -3,51 +3,174 @@
       <title>Form Example</title>
       <link href="/remote.css" rel="stylesheet" />
       <link href="/custom.css" rel="stylesheet" />
-% if refresh and action=="STOP":
-    <meta http-equiv="refresh" content="{{refresh*60}}">
-% end
-    <script src="//ajax.googleapis.com/ajax/libs/jquery/1.8.2/jquery.min.js"></script>
-    <script src="//code.jquery.com/ui/1.12.1/jquery-ui.min.js"></script>
-
     <script type="text/javascript">
-        $(document).ready(function() {
-            $('.autocomplete').autocomplete({
-                delay:500,
-                maxResults: 10,
-                source: function(request, response) {
-                    $this = $(this.element);
-                    $.ajax({
-                        type : 'POST',
-                        url: '/query_category',
-                        data: {'service': $this.attr('data-service'), 'category': request.term},
-                        success: function(data) {response(data)}
+        function post(url, data) {
+            return fetch(url, {method: 'POST', body: new URLSearchParams(data)}).then(function(response) {return response.json()});
+        }
+
+        function autocomplete(input) {
+            // Same markup and classes as the jQuery UI widget so remote.css keeps styling it
+            var menu = document.createElement('ul');
+            var timer = null;
+            var request = 0;
+            menu.className = 'ui-autocomplete';
+            document.body.appendChild(menu);
+
+            function hide() {
+                menu.style.display = 'none';
+            }
+            function choose(item) {
+                input.value = item.textContent;
+                hide();
+            }
+            function show(names) {
+                menu.innerHTML = '';
+                names.slice(0, 10).forEach(function(name) {
+                    var li = document.createElement('li');
+                    var div = document.createElement('div');
+                    div.textContent = name;
+                    div.addEventListener('mousedown', function(e) {e.preventDefault(); choose(div)});  // Before the input loses the focus
+                    div.addEventListener('mouseenter', function() {activate(div)});
+                    li.appendChild(div);
+                    menu.appendChild(li);
+                });
+                var rect = input.getBoundingClientRect();
+                menu.style.top = (rect.bottom + window.scrollY) + 'px';
+                menu.style.left = (rect.left + window.scrollX) + 'px';
+                menu.style.display = names.length ? 'block' : 'none';
+            }
+            function activate(item) {
+                var current = menu.querySelector('.ui-state-active');
+                if (current) {
+                    current.classList.remove('ui-state-active');
+                }
+                if (item) {
+                    item.classList.add('ui-state-active');
+                }
+            }
+            input.addEventListener('input', function() {
+                clearTimeout(timer);
+                timer = setTimeout(function() {
+                    var current = ++request;  // Answers of older requests are ignored
+                    var service = input.getAttribute('data-service');
+                    var query = service ? post('/query_category', {'service': service, 'category': input.value}) : post('/query_game', {'category': input.value});
+                    query.then(function(data) {
+                        if (current == request && document.activeElement == input) {
+                            show(service ? Object.keys(data) : data['games']);
+                        }
                     });
+                }, 250);
+            });
+            input.addEventListener('keydown', function(e) {
+                var items = Array.prototype.slice.call(menu.querySelectorAll('div'));
+                var index = items.indexOf(menu.querySelector('.ui-state-active'));
+                if (menu.style.display != 'block') {
+                    return;
+                } else if (e.key == 'ArrowDown' || e.key == 'ArrowUp') {
+                    if (e.key == 'ArrowDown') {
+                        index = (index + 1) % items.length;
+                    } else {
+                        index = index <= 0 ? items.length - 1 : index - 1;
+                    }
+                    activate(items[index]);
+                    e.preventDefault();
+                } else if (e.key == 'Enter' && index != -1) {
+                    choose(items[index]);
+                    e.preventDefault();
+                } else if (e.key == 'Escape') {
+                    hide();
                 }
             });
+            input.addEventListener('blur', hide);
+        }
+
+        document.addEventListener('DOMContentLoaded', function() {
+            document.querySelectorAll('.autocomplete').forEach(autocomplete);
+        });
 
+        document.addEventListener('DOMContentLoaded', function() {
+            function reload_later() {
+                setTimeout(function() {location.reload()}, {{refresh}} * 60000);
+            }
+            if (!window.EventSource) {
+                return reload_later();  // No live updates
+            }
+            var updated = {{!updated or 'null'}};
+            var events = new EventSource('/events');
+            events.onerror = function() {
+                if (events.readyState == EventSource.CLOSED) {
+                    reload_later();  // Refused by the server or the browser gave up on reconnecting
+                }
+            };
+            events.onmessage = function(e) {
+                var diff = JSON.parse(e.data);
+                if ('running' in diff) {
+                    var action = diff['running'] ? 'STOP' : 'START';
+                    document.body.classList.toggle('started', diff['running']);
+                    document.body.classList.toggle('stopped', !diff['running']);
+                    document.querySelectorAll('button.action').forEach(function(button) {
+                        button.value = action;
+                        button.textContent = action;
+                    });
+                }
+                if ('process' in diff) {
+                    document.querySelectorAll('.process').forEach(function(p) {p.textContent = diff['process'] || ''});
+                }
+                if ('updated' in diff) {
+                    updated = diff['updated'];
+                }
+                for (var service in diff['services'] || {}) {
+                    var infos = diff['services'][service];
+                    var row = document.getElementById('service_' + service);
+                    if (!row || infos === null) {
+                        location.reload();  // The list of services changed
+                        return;
+                    }
+                    if ('online' in infos) {
+                        row.classList.toggle('online', !!infos['online']);
+                        row.classList.toggle('offline', !infos['online']);
+                    }
+                    if ('viewers' in infos) {
+                        row.querySelector('.viewers').textContent = infos['viewers'] === null ? 'None' : infos['viewers'];
+                    }
+                    ['title', 'category'].forEach(function(key) {
+                        document.querySelectorAll('.' + service + '_' + key).forEach(function(input) {
+                            if (key in infos && input != document.activeElement) {
+                                input.value = infos[key];
+                            }
+                        });
+                    });
+                }
+            };
+            setInterval(function() {
+                if (updated) {
+                    document.querySelectorAll('.age').forEach(function(p) {
+                        p.textContent = 'Updated ' + Math.max(0, Math.round(Date.now() / 1000 - updated)) + 's ago';
+                    });
+                }
+            }, 1000);
         });
 
-        $(document).ready(function() {
-            $('.blur').blur(function() {
-                $(this).closest("form").submit();
+        document.addEventListener('DOMContentLoaded', function() {
+            document.querySelectorAll('.blur').forEach(function(input) {
+                input.addEventListener('blur', function() {
+                    input.form.dispatchEvent(new Event('submit', {cancelable: true}));
+                });
             });
         });
 
-        $(document).ready(function() {
-            $('.update').submit(function(e) {
-                $.ajax({
-                    type: 'POST',
-                    url: '/update_title',
-                    data: $(this).serialize(),
-                    success: function(response) {
-                        for (service in response) {
-                            $('.' +  service + '_title').val(response[service]['title']);
-                            $('.' +  service + '_category').val(response[service]['category']);
+        document.addEventListener('DOMContentLoaded', function() {
+            document.querySelectorAll('.update').forEach(function(form) {
+                form.addEventListener('submit', function(e) {
+                    post('/update_title', new FormData(form)).then(function(response) {
+                        for (var service in response) {
+                            document.querySelectorAll('.' + service + '_title').forEach(function(input) {input.value = response[service]['title']});
+                            document.querySelectorAll('.' + service + '_category').forEach(function(input) {input.value = response[service]['category']});
                         }
-                        $('#footer')[0].reset();
-                    }
+                        document.getElementById('footer').reset();
+                    });
+                    e.preventDefault();
                 });
-                e.preventDefault();
             });
         });
   </script>
@@ -59,7 +182,7 @@
     <ul class="streams">
     % for service, stream in services.items():
     % if stream['enabled']:
-        <li class="{{!"online" if stream['infos']['online'] else "offline"}}"><span class='service_name' style="background-image:url('/images/{{service}}.png')"></span>    <span class='viewers'>{{stream['infos']['viewers']}}</span>
+        <li id="service_{{service}}" class="{{!"online" if stream['infos']['online'] else "offline"}}"><span class='service_name' style="background-image:url('/images/{{service}}.png')"></span>    <span class='viewers'>{{stream['infos']['viewers']}}</span>
     <form method="POST" class="service update" action="/">
         <input name="service" type="hidden" value="{{service}}" />
         <input name="category" data-service="{{service}}" type="text" value="{{stream['infos']['category']}}" class="{{service}}_category autocomplete blur" /><br />
@@ -70,6 +193,8 @@
     % end
     % end
     </ul>
+    <p class="age">{{'Updated {}s ago'.format(age) if age is not None else 'Updating...'}}</p>
+    <p class="process">{{process}}</p>
     % else:
     <p>Welcome to the Stream Manager, you can update your stream title and category automatically depending on which software is running on the foreground and has the focus.</p>
     <ol>
@@ -90,7 +215,7 @@
 
 
     <form method="POST" id="footer" class="update" action="/update_title" title="Change all streams at once, disable the automatic checks if you use different programs and want to keep your modifications" {{!'style="display:none"' if len(services) < 2 else ''}}>
-        <input name="category" type="text" value="" placeholder="Category"/>
+        <input name="category" type="text" value="" placeholder="Category" class="autocomplete"/>
         <input name="title" type="text" value="" placeholder="Title" />
         <input type="submit" value="Submit" /><br/>
     </form>
@@ -15,6 +15,7 @@ class Main(Service):
     apibase = 'https://graph.facebook.com/v5.0'
     devurl = 'https://developers.facebook.com/apps/'
     features = {'title': True, 'category': False, 'tags': False, 'clips': False, 'markers': False}
+    endedstatus = ['LIVE_STOPPED', 'VOD', 'PROCESSING']
 
     @functools.lru_cache(maxsize=128)
     def query_category(self, category):
@@ -23,10 +24,23 @@ class Main(Service):
         result = {}
         for i in response.json()['data']:
             result[i['name']] = i['id']
+            self.cache_category(i['name'], True, i['id'])
         return result
 
     def validate_category(self, category):
-        return bool(self.query_category(category).get(category, False))
+        cached = self.get_cachedcategory(category)
+        if cached:
+            return cached['valid']
+        valid = bool(self.query_category(category).get(category, False))
+        if not valid:
+            self.cache_category(category, False)
+        return valid
+
+    def get_categoryid(self, category):
+        cached = self.get_cachedcategory(category)
+        if cached:
+            return cached.get('id')
+        return self.query_category(category).get(category)
 
     def get_channel_id(self):
         address = '{}/me?fields=id'.format(self.apibase)
@@ -35,15 +49,22 @@ class Main(Service):
 
     def get_channel_info(self):
         params = {'fields': 'live_views,title,status'}
-        address = '{}/{}'.format(self.apibase, self.video_id)
-        result = self.request('get', address, params=params).json()
+        response = self.request_video('get', params=params)
+        result = response.json()
         online = True if result['status'] == 'LIVE' else False
         viewers = result['live_views'] if online else None
+        if result['status'] in self.endedstatus:
+            self._video_id = None  # The next call will use or create a new live video
         self.infos = {'online': online, 'title': result['title'], 'name': '', 'category': '', 'viewers': viewers}
         return self.infos
 
     @property
     def video_id(self):
+        if not getattr(self, '_video_id', None):
+            self._video_id = self.get_video_id()
+        return self._video_id
+
+    def get_video_id(self):
         try:
             address = '{}/{}/live_videos?fields=live_views,status,ingest_streams'.format(self.apibase, self.config['channel_id'])
             result = self.request('get', address).json()['data'][0]
@@ -53,16 +74,25 @@ class Main(Service):
             result = self.request('post', address).json()
         return result['id']
 
+    def request_video(self, action, data=None, params=None):
+        # The cached live video can be deleted or replaced, resolve it again once if it does not exist anymore
+        address = '{}/{}'.format(self.apibase, self.video_id)
+        response = self.request(action, address, data=data, params=params)
+        if response.status_code == 404 or response.status_code == 400 and response.json().get('error', {}).get('code') == 100:
+            self._video_id = None
+            address = '{}/{}'.format(self.apibase, self.video_id)
+            response = self.request(action, address, data=data, params=params)
+        return response
+
     def update_channel(self, infos):
         infos = super().update_channel(infos)
         data = {}
         if infos.get('title'):
             data['title'] = infos['title']
         if infos.get('category'):
-            idtag = self.query_category(infos['category']).get(infos['category'])
+            idtag = self.get_categoryid(infos['category'])
             if idtag:
                 data['content_tags'] = idtag
         if data:
             self.get_token()
-            address = '{}/{}'.format(self.apibase, self.video_id)
-            return self.request('post', address, data=data)
+            return self.request_video('post', data=data)
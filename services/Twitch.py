@@ -27,23 +27,7 @@ class Main(Service):
         self.headers['Accept'] = 'application/vnd.twitchtv.v5+json'
 
     def get_channel_info(self):
-        self.get_token()
-        address = '{}/channels?broadcaster_id={}'.format(self.apibase2, self.config['channel_id'])
-        result = self.request('get', address, headers=self.headers2).json()['data'][0]
-        address = '{}/streams?user_id={}'.format(self.apibase2, self.config['channel_id'])
-        online = self.request('get', address, headers=self.headers2).json()
-        try:
-            online = online['data']
-        except KeyError:
-            print(online)
-        try:
-            viewers = online[0]['viewer_count']
-            online = True
-        except (IndexError, KeyError):
-            viewers = None
-            online = False
-        self.infos = {'online': online, 'title': result['title'], 'name': result['broadcaster_name'], 'category': result['game_name'], 'viewers': viewers}
-        return self.infos
+        return self.manager.run_coroutine(self.asynchronous.get_channel_info())
 
     def get_gamedescription(self):
         general_description = self.manager.config['base']['description'] or ''
@@ -67,29 +51,48 @@ class Main(Service):
             response = self.request('get', address, headers=self.headers2, params=params)
             for i in response.json()['data'] or []:
                 result[i['name']] = str(i['id'])
+                self.cache_category(i['name'], True, str(i['id']))
         return result
 
-    @functools.lru_cache(maxsize=128)
     def validate_category(self, category):
         if category:
+            cached = self.get_cachedcategory(category)
+            if cached:
+                return cached['valid']
             params = {'name': category}
             address = '{}/games'.format(self.apibase2)
             result = self.request('get', address, headers=self.headers2, params=params).json()['data']
+            self.cache_category(category, bool(result), str(result[0]['id']) if result else None)
             return bool(result)
 
+    def validate_categories(self, categories):
+        result = {}
+        missing = []
+        for category in set(filter(None, categories)):
+            cached = self.get_cachedcategory(category)
+            if cached:
+                result[category] = cached['valid']
+            else:
+                missing.append(category)
+        address = '{}/games'.format(self.apibase2)
+        for i in range(0, len(missing), 100):  # Maximum number of names accepted by the endpoint
+            chunk = missing[i:i+100]
+            params = [('name', category) for category in chunk]
+            found = {game['name'].casefold(): str(game['id']) for game in self.request('get', address, headers=self.headers2, params=params).json()['data']}
+            for category in chunk:
+                gameid = found.get(category.casefold())
+                self.cache_category(category, bool(gameid), gameid)
+                result[category] = bool(gameid)
+        return result
+
+    def get_categoryid(self, category):
+        cached = self.get_cachedcategory(category)
+        if cached and cached.get('id'):
+            return cached['id']
+        return self.query_category(category)[category]
+
     def update_channel(self, infos):
-        infos = super().update_channel(infos)
-        data = {}
-        if infos.get('title'):
-            data['title'] = infos['title']
-        if infos.get('category'):
-            data['game_id'] = self.query_category(infos['category'])[infos['category']]
-        if infos.get('tags'):
-            self.update_tags(infos['tags'])
-        if data:
-            self.get_token()
-            address = '{}/channels?broadcaster_id={}'.format(self.apibase2, self.config['channel_id'])
-            return self.request('patch', address, headers=self.headers2, data=data)
+        return self.manager.run_coroutine(self.asynchronous.update_channel(infos))
 
     def get_channel_id(self):
         address = '{}/users'.format(self.apibase2)
@@ -97,23 +100,28 @@ class Main(Service):
         self.config['channel_id'] = result['data'][0]['id']
         self.config['name'] = result['data'][0]['display_name']
 
+    def create_datasets(self):
+        self.tags = tools.Dataset(self.get_cachepath('tags'), self.fetch_tags).start()
+
+    def fetch_tags(self):
+        alltags = {}
+        cursor = ''
+        while cursor is not None:
+            address = '{}/tags/streams?first=100&after={}'.format(self.apibase2, cursor)
+            response = self.request('get', address, headers=self.headers2).json()
+            for i in response['data']:
+                for name in i['localization_names'].values():
+                    alltags[name.lower()] = i['tag_id']
+            cursor = response['pagination'].get('cursor')
+        return alltags
+
     @property
     def alltags(self):
-        try:
-            return self._alltags
-        except AttributeError:
-            self._alltags = {}
-            cursor = ''
-            while cursor is not None:
-                address = '{}/tags/streams?first=100&after={}'.format(self.apibase2, cursor)
-                response = self.request('get', address, headers=self.headers2).json()
-                for i in response['data']:
-                    self._alltags[i['localization_names']['en-us']] = i['tag_id']
-                cursor = response['pagination'].get('cursor')
-            return self._alltags
+        return self.tags.wait(int(self.manager.config['base']['timeout']))
 
     def get_tagsid(self, tags):
-        tagsid = [v for k,v in self.alltags.items() if k in tags]
+        alltags = self.alltags
+        tagsid = [alltags[i.lower()] for i in tags if i.lower() in alltags]
         return tagsid
 
     def update_tags(self, tags):
@@ -128,54 +136,11 @@ class Main(Service):
                 logger.error(response.json())
             return response
 
-    @tools.threaded
-    def create_clip(self):
-        start = time.time()
-        self.get_token()
-        address = '{}/streams?user_id={}'.format(self.apibase2, self.config['channel_id'])
-        response = self.request('get', address, headers=self.headers2)
-        online = response.json()['data']
-        if online:
-            if self.config['delay']:
-                elapsed = time.time() - start
-                delay = int(self.config['delay']) - elapsed
-                time.sleep(max(0, delay))
-            address = '{}/clips?broadcaster_id={}'.format(self.apibase2, self.config['channel_id'])
-            response = self.request('post', address, headers=self.headers2)
-            time.sleep(15)
-            address = '{}/clips?id={}'.format(self.apibase2, response.json()['data'][0]['id'])
-            response2 = self.request('get', address, headers=self.headers2)
-            if response2.json()['data']:
-                logger.log(777, 'Your Twitch Clip has been created at this URL: {}'.format(response2.json()['data'][0]['url']))
-            else:
-                logger.error("Couldn't seem to create the clip.")
-            return response
-        else:
-            logger.error("Can't create a clip if you are not streaming.")
-
-    @tools.threaded
-    def create_marker(self):
-        start = time.time()
-        self.get_token()
-        address = '{}/streams?user_id={}'.format(self.apibase2, self.config['channel_id'])
-        response = self.request('get', address, headers=self.headers2)
-        online = response.json()['data']
-        if online:
-            if self.config['delay']:
-                elapsed = time.time() - start
-                delay = int(self.config['delay']) - elapsed
-                time.sleep(max(0, delay))
-            params = {'user_id': self.config['channel_id'], 'description': 'Created automatically with StreamManager'}
-            address = '{}/streams/markers'.format(self.apibase2)
-            response = self.request('post', address, headers=self.headers2, params=params)
-            if response.json()['data']:
-                logger.log(777, 'Your Twitch Marker has been created: {} - {}'.format(response.json()['data'][0]['id'], response.json()['data'][0]['created_at']))
-            else:
-                logger.error("Couldn't seem to create the marker.")
-            return response
-        else:
-            logger.error("Can't create a marker if you are not streaming.")
-
+    def get_deadline(self, method):
+        deadline = super().get_deadline(method)
+        if method == 'create_clip':
+            deadline += 15  # Time for the clip to be processed before its URL is available
+        return deadline
 
     def create_commandbot(self):
         # Clean up the old bot if there is any
@@ -201,6 +166,82 @@ class Main(Service):
         self.future = asyncio.run_coroutine_threadsafe(self.manager.commandbots['Twitch'].start(), loop)
 
 
+class AsyncMain(AsyncService):
+    async def get_channel_info(self):
+        await self.run(self.service.get_token)
+        address = '{}/channels?broadcaster_id={}'.format(self.service.apibase2, self.config['channel_id'])
+        address2 = '{}/streams?user_id={}'.format(self.service.apibase2, self.config['channel_id'])
+        result, online = await asyncio.gather(self.request('get', address, headers=self.service.headers2), self.request('get', address2, headers=self.service.headers2))
+        result = result.json()['data'][0]
+        online = online.json().get('data') or []
+        viewers = online[0]['viewer_count'] if online else None
+        self.service.infos = {'online': bool(online), 'title': result['title'], 'name': result['broadcaster_name'], 'category': result['game_name'], 'viewers': viewers}
+        return self.service.infos
+
+    async def get_categoryid(self, category):
+        return await self.run(self.service.get_categoryid, category)
+
+    async def update_channel(self, infos):
+        infos = await self.prepare_update(infos)
+        data = {}
+        pending = []
+        if infos.get('title'):
+            data['title'] = infos['title']
+        if infos.get('category'):
+            data['game_id'] = await self.get_categoryid(infos['category'])
+        if infos.get('tags'):
+            pending.append(self.run(self.service.update_tags, infos['tags']))
+        if data:
+            address = '{}/channels?broadcaster_id={}'.format(self.service.apibase2, self.config['channel_id'])
+            pending.insert(0, self.request('patch', address, headers=self.service.headers2, data=data))
+        results = await asyncio.gather(*pending)
+        return results[0] if data else None
+
+    async def is_online(self):
+        address = '{}/streams?user_id={}'.format(self.service.apibase2, self.config['channel_id'])
+        response = await self.request('get', address, headers=self.service.headers2)
+        return bool(response.json()['data'])
+
+    async def wait_delay(self, start):
+        if self.config['delay']:
+            elapsed = time.time() - start
+            await asyncio.sleep(max(0, int(self.config['delay']) - elapsed))
+
+    async def create_clip(self):
+        start = time.time()
+        await self.run(self.service.get_token)
+        if not await self.is_online():
+            logger.error("Can't create a clip if you are not streaming.")
+            return None
+        await self.wait_delay(start)
+        address = '{}/clips?broadcaster_id={}'.format(self.service.apibase2, self.config['channel_id'])
+        response = await self.request('post', address, headers=self.service.headers2)
+        await asyncio.sleep(15)
+        address = '{}/clips?id={}'.format(self.service.apibase2, response.json()['data'][0]['id'])
+        response2 = await self.request('get', address, headers=self.service.headers2)
+        if response2.json()['data']:
+            logger.log(777, 'Your Twitch Clip has been created at this URL: {}'.format(response2.json()['data'][0]['url']))
+        else:
+            logger.error("Couldn't seem to create the clip.")
+        return response
+
+    async def create_marker(self):
+        start = time.time()
+        await self.run(self.service.get_token)
+        if not await self.is_online():
+            logger.error("Can't create a marker if you are not streaming.")
+            return None
+        await self.wait_delay(start)
+        params = {'user_id': self.config['channel_id'], 'description': 'Created automatically with StreamManager'}
+        address = '{}/streams/markers'.format(self.service.apibase2)
+        response = await self.request('post', address, headers=self.service.headers2, params=params)
+        if response.json()['data']:
+            logger.log(777, 'Your Twitch Marker has been created: {} - {}'.format(response.json()['data'][0]['id'], response.json()['data'][0]['created_at']))
+        else:
+            logger.error("Couldn't seem to create the marker.")
+        return response
+
+
 class Bot(commands.Bot):
     def __init__(self, name):
         self.manager = common.manager.ManageStream()
@@ -1,5 +1,8 @@
 # coding: utf-8
+import sys
 import logging
+import functools
+import collections
 import common.tools as tools
 from common.service import *
 logger = logging.getLogger(__name__)
@@ -14,27 +17,27 @@ class Main(Service):
     apibase = 'https://www.googleapis.com/youtube/v3'
     devurl = 'https://console.developers.google.com/apis/credentials'
     features = {'title': True, 'category': True, 'tags': False, 'clips': False, 'markers': False}
+    quotacosts = {('get', 'videos'): 1, ('put', 'videos'): 50, ('get', 'videoCategories'): 1, ('get', 'liveBroadcasts'): 5}
 
     def get_channel_info(self):
-        address = '{}/liveBroadcasts?part=snippet,topicDetails&broadcastType=persistent&mine=true'.format(self.apibase)
-        result = self.request('get', address).json()
-        address = '{}/videos?part=snippet&id={}'.format(self.apibase, result['items'][0]['id'])
-        result2 = self.request('get', address).json()
-        name = result2['items'][0]['snippet']['channelTitle']
-        categoryId = result2['items'][0]['snippet']['categoryId']
-        category = next((cat for cat, catid in self.gamesid.items() if catid == categoryId), '')
-        address = '{}/liveBroadcasts?part=snippet&broadcastStatus=active&broadcastType=persistent'.format(self.apibase)
-        online = bool(self.request('get', address).json()['items'])
-        if online:
-            params = {'id': result['items'][0]['id'], 'part': 'liveStreamingDetails'}
-            address = '{}/videos'.format(self.apibase)
-            viewers = self.request('get', address, params=params).json()
-            viewers = viewers['items'][0]['liveStreamingDetails'].get('concurrentViewers', 0)
-        else:
-            viewers = None
-        self.infos = {'online': online, 'title': result['items'][0]['snippet']['title'], 'name': name, 'category': category, 'viewers': viewers, 'channel_id': result['items'][0]['id']}
+        video = self.get_broadcastvideo()
+        online = video['snippet'].get('liveBroadcastContent') == 'live'
+        viewers = video.get('liveStreamingDetails', {}).get('concurrentViewers', 0) if online else None
+        category = self.gamesid.key(video['snippet']['categoryId'], '')
+        self.infos = {'online': online, 'title': video['snippet']['title'], 'name': video['snippet']['channelTitle'], 'category': category, 'viewers': viewers, 'channel_id': video['id']}
         return self.infos
 
+    def get_broadcastvideo(self):
+        # The video of the persistent broadcast contains everything needed, it is only looked up again if it disappeared
+        address = '{}/videos?part=snippet,liveStreamingDetails&id={}'
+        if self.config.get('channel_id'):
+            result = self.request('get', address.format(self.apibase, self.config['channel_id'])).json()
+            if result.get('items'):
+                return result['items'][0]
+        broadcasts = '{}/liveBroadcasts?part=id&broadcastType=persistent&mine=true'.format(self.apibase)
+        self.config['channel_id'] = self.request('get', broadcasts).json()['items'][0]['id']
+        return self.request('get', address.format(self.apibase, self.config['channel_id'])).json()['items'][0]
+
     def query_category(self, category):
         return self.gamesid
 
@@ -63,20 +66,39 @@ class Main(Service):
         result = self.get_channel_info()
         self.config['channel_id'] = result['channel_id']
 
+    def create_datasets(self):
+        self.quota = collections.Counter()
+        region = self.config.get('region') or 'us'
+        self.videocategories = tools.Dataset(self.get_cachepath('categories_' + region), functools.partial(self.fetch_categories, region), interval=604800).start()
+
+    def fetch_categories(self, region):
+        categories = {}
+        address = '{}/videoCategories?part=snippet&regionCode={}'.format(self.apibase, region)
+        response = self.request('get', address)
+        for i in response.json()['items']:
+            categories[i['snippet']['title']] = i['id']
+        return categories
+
     @property
     def gamesid(self):
-        try:
-            return self._gamesid
-        except AttributeError:
-            self._gamesid = {}
-            address = '{}/videoCategories?part=snippet&regionCode=us'.format(self.apibase)
-            response = self.request('get', address)
-            for i in response.json()['items']:
-                self._gamesid[i['snippet']['title']] = i['id']
-            return self._gamesid
+        data = self.videocategories.wait(int(self.manager.config['base']['timeout']))
+        if getattr(self, '_gamesid', None) is None or self._gamesid_source is not data:
+            self._gamesid = tools.BidirectionalMap(data)
+            self._gamesid_source = data
+        return self._gamesid
 
-    def request(self, action, address, headers=None, data=None, params=None):
-        response = super().request(action, address, headers, data, params)
-        if response.status_code == '403':
+    def request(self, action, address, headers=None, data=None, params=None, operation=None):
+        if operation is None:
+            operation = sys._getframe(2).f_code.co_name  # Skip the catch_exception wrapper, the quota is counted per operation
+        response = super().request(action, address, headers, data, params, operation=operation)
+        self.count_quota(action, address, operation)
+        if response.status_code == 403:
             logger.error("Daily Limits for API calls reached, you won't be able to use that service until midnight Pacific Time.")
         return response
+
+    def count_quota(self, action, address, operation=None):
+        resource = address[len(self.apibase):].strip('/').split('?')[0]
+        cost = self.quotacosts.get((action, resource), 1)
+        self.quota[operation or resource] += cost
+        self.quota['total'] += cost
+        logger.debug('Youtube quota: {} units for {}, {} units used since start'.format(cost, operation or resource, self.quota['total']))